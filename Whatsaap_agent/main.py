@@ -1,41 +1,129 @@
 import os
 import csv
 import asyncio
+import atexit
+import io
 import logging
+import logging.handlers
+import queue
 import re
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from typing import BinaryIO
 from fastapi import FastAPI, BackgroundTasks, UploadFile, File, Form
-import httpx
+import orjson
 import uvicorn
 import shutil
 from fastapi.middleware.cors import CORSMiddleware
 
 from dotenv import load_dotenv
 
+import whatsapp_client
+from phone_numbers import normalize_phone
+
 # Load environment variables
 load_dotenv()
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Set up logging; records are queued and written to stderr by a background thread,
+# so logging inside the send loop never blocks the event loop on console I/O.
+# `python main.py` imports this module twice (as __main__, then as main for uvicorn),
+# so like basicConfig this does nothing once the root logger has a handler.
+if not logging.root.handlers:
+    _log_queue = queue.SimpleQueue()
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+    logging.root.setLevel(logging.INFO)
+    logging.root.addHandler(logging.handlers.QueueHandler(_log_queue))
+    log_listener.start()
+    atexit.register(log_listener.stop)
+# httpx logs every request at INFO, i.e. once per message sent
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-# Environment variables
-WHATSAPP_API_TOKEN = os.getenv("ACCESS_TOKEN")
-WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
-WHATSAPP_API_URL = f"https://graph.facebook.com/v22.0/{WHATSAPP_PHONE_NUMBER_ID}/messages"
-
-
 # Create uploads directory if it doesn't exist
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Set the delay between messages (in seconds)
-MESSAGE_DELAY = 15
+# Buffer size used when writing uploaded files to disk (1 MiB)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Read buffer used when parsing campaign CSVs (1 MiB instead of the 8 KiB default)
+CSV_READ_BUFFER = 1 << 20
+
+# Maximum number of messages in flight at once, across all campaigns
+MAX_CONCURRENT_SENDS = int(os.getenv("MAX_CONCURRENT_SENDS", "32"))
+SEND_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+
+# Rows queued ahead of the send workers per campaign; bounds memory for large CSVs
+MAX_PENDING_SENDS = 2 * MAX_CONCURRENT_SENDS
+
+# Country code assumed for numbers written without one
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "91")
+
+# Matches {{variable_name}} placeholders in message templates
+TEMPLATE_VAR_RE = re.compile(r'{{([^{}]+)}}')
+
+@dataclass(slots=True)
+class CampaignStats:
+    """Progress counters for a single campaign"""
+    status: str = "processing"
+    total: int = 0
+    processed: int = 0
+    successful: int = 0
+    failed: int = 0
+    skipped: int = 0
 
-# Campaign status tracking
-campaign_status = {}
+class CampaignStatusCache(OrderedDict):
+    """CampaignStats by filename; past maxsize, the least recently used finished campaigns are evicted"""
+    
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+    
+    def get(self, key, default=None):
+        """Look up a campaign and mark it as recently used"""
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+    
+    def __setitem__(self, key, value):
+        if key in self:
+            self.move_to_end(key)
+        super().__setitem__(key, value)
+        excess = len(self) - self.maxsize
+        if excess > 0:
+            # Campaigns still processing are never evicted, so their pollers keep seeing progress
+            finished = [k for k, stats in self.items() if stats.status != "processing"]
+            for k in finished[:excess]:
+                del self[k]
+
+# Result details buffered in memory per campaign, written in batches of RESULTS_FLUSH_BATCH
+# or at least every RESULTS_FLUSH_INTERVAL seconds
+RESULTS_QUEUE_SIZE = 10_000
+RESULTS_FLUSH_BATCH = 1000
+RESULTS_FLUSH_INTERVAL = 2.0
+
+# Number of campaigns whose status is kept in memory
+MAX_TRACKED_CAMPAIGNS = 256
+
+# Campaign status tracking (counters only; per-contact results are written to disk)
+campaign_status = CampaignStatusCache(MAX_TRACKED_CAMPAIGNS)
+status_lock = asyncio.Lock()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared WhatsApp API client on startup and close it on shutdown"""
+    await whatsapp_client.open_client()
+    try:
+        yield
+    finally:
+        await whatsapp_client.close_client()
 
 # FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -46,147 +134,261 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-async def send_whatsapp_text_message(phone: str, text_message: str) -> bool:
-    """Send a personalized text message via WhatsApp Cloud API"""
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_API_TOKEN}",
-        "Content-Type": "application/json"
-    }
+@dataclass(slots=True, frozen=True)
+class MessageTemplate:
+    """A message template parsed once into literal text and the {{variables}} between it"""
+    literals: tuple[str, ...]
+    variables: tuple[str, ...]
     
-    data = {
-        "messaging_product": "whatsapp",
-        "to": phone,
-        "type": "text",
-        "text": {
-            "body": text_message
-        }
+    def render(self, contact_data: dict) -> str:
+        """Replace all {{variables}} in the template with values from contact_data"""
+        pieces = [self.literals[0]]
+        for var, literal in zip(self.variables, self.literals[1:]):
+            # Missing variables become a visible placeholder; callers warn once per campaign, not per row
+            value = contact_data.get(var)
+            if value is None:
+                value = f"[{var}]"
+            pieces.append(value)
+            pieces.append(literal)
+        return "".join(pieces)
+
+def build_template(template_message: str) -> MessageTemplate:
+    """Parse a message template once so it can be rendered cheaply for every contact"""
+    # Splitting on the {{variable}} pattern alternates literal text and variable names
+    parts = TEMPLATE_VAR_RE.split(template_message)
+    return MessageTemplate(literals=tuple(parts[0::2]), variables=tuple(parts[1::2]))
+
+def _count_data_lines(f: BinaryIO) -> int:
+    """Cheaply count data lines in a CSV by counting newline bytes, then rewind for parsing"""
+    newlines = 0
+    last = b'\n'
+    while chunk := f.read(CSV_READ_BUFFER):
+        newlines += chunk.count(b'\n')
+        last = chunk[-1:]
+    f.seek(0)
+    # A last line without a trailing newline still counts; the header line does not
+    return max(newlines + (last != b'\n') - 1, 0)
+
+def _result_detail(contact: dict, success: bool, message: str) -> dict:
+    """Build the per-contact result record written to the campaign results file"""
+    return {
+        "phone": contact.get('Mobile') or 'unknown',
+        "company": contact.get('Name of the Exhibitor', 'unknown'),
+        "success": success,
+        "message": message
     }
+
+async def _record_result(stats: CampaignStats, results: asyncio.Queue, outcome: str, detail: dict):
+    """Count a contact as "successful", "failed" or "skipped" and queue its result detail"""
+    async with status_lock:
+        stats.processed += 1
+        if outcome == "successful":
+            stats.successful += 1
+        elif outcome == "skipped":
+            stats.skipped += 1
+        else:
+            stats.failed += 1
     
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(WHATSAPP_API_URL, headers=headers, json=data)
-            if response.status_code == 200:
-                logger.info(f"Message sent successfully to {phone}")
-                return True
-            else:
-                logger.error(f"Failed to send message: {response.text}")
-                return False
-    except Exception as e:
-        logger.error(f"Error sending WhatsApp message: {str(e)}")
-        return False
+    await results.put(detail)
 
-def personalize_message(template_message: str, contact_data: dict) -> str:
-    """Replace all {{variables}} in the template with values from contact_data"""
-    # Find all variables in the template (pattern: {{variable_name}})
-    variables = re.findall(r'{{([^{}]+)}}', template_message)
+async def _send_one(
+    contact: dict,
+    template: MessageTemplate,
+    stats: CampaignStats,
+    results: asyncio.Queue
+):
+    """Personalize and send the message for a single validated contact, then record the outcome"""
+    async with SEND_SEMAPHORE:
+        try:
+            # Personalize the message with all available fields from the CSV
+            personalized_message = template.render(contact)
+            
+            # Send personalized text message (rate limited inside the sender)
+            success = await whatsapp_client.send_text(contact['Mobile'], personalized_message)
+            
+            detail = _result_detail(contact, success, "Message sent" if success else "Failed to send")
+        except whatsapp_client.DeliveryUnknownError as e:
+            # Counted as failed, but flagged so the contact is checked before anyone re-sends
+            logger.error("Unknown delivery to %s: %s", contact['Mobile'], e)
+            success = False
+            detail = _result_detail(contact, False, f"Unknown delivery, not retried: {e}")
+        except Exception as e:
+            logger.error("Error processing contact: %s", e)
+            success = False
+            detail = _result_detail(contact, False, f"Error: {str(e)}")
     
-    # Create a personalized message by replacing each variable
-    personalized_message = template_message
-    for var in variables:
-        placeholder = f"{{{{{var}}}}}"
-        if var in contact_data:
-            personalized_message = personalized_message.replace(placeholder, contact_data[var])
-        else:
-            # If the variable is not found in the data, leave it as is or replace with a default value
-            logger.warning(f"Variable {var} not found in contact data for personalization")
-            personalized_message = personalized_message.replace(placeholder, f"[{var}]")
+    await _record_result(stats, results, "successful" if success else "failed", detail)
+
+def _append_lines(results_file: BinaryIO, lines: list[bytes]):
+    """Write a batch of lines and flush it to the OS; blocking, so callers run it in a worker thread"""
+    results_file.writelines(lines)
+    results_file.flush()
+
+async def _send_worker(
+    rows: asyncio.Queue,
+    template: MessageTemplate,
+    stats: CampaignStats,
+    results: asyncio.Queue
+):
+    """Send messages for rows taken from the queue until a None sentinel arrives"""
+    while (row := await rows.get()) is not None:
+        await _send_one(row, template, stats, results)
+
+async def _results_writer(results_file: BinaryIO, queue: asyncio.Queue):
+    """Single writer that drains result details from the queue and appends them to a JSONL file in batches"""
+    loop = asyncio.get_running_loop()
+    batch = []
+    flush_at = loop.time() + RESULTS_FLUSH_INTERVAL
+    # A write error is raised only after the None sentinel; until then the queue keeps
+    # draining so senders never block on a dead writer
+    write_error = None
+    
+    async def flush():
+        nonlocal write_error
+        if batch and write_error is None:
+            try:
+                await asyncio.to_thread(_append_lines, results_file, batch)
+            except OSError as e:
+                write_error = e
+        batch.clear()
+    
+    with results_file:
+        while True:
+            try:
+                detail = await asyncio.wait_for(queue.get(), max(flush_at - loop.time(), 0))
+            except asyncio.TimeoutError:
+                detail = ...
+            
+            # None marks the end of the campaign
+            if detail is None:
+                break
+            if detail is not ... and write_error is None:
+                batch.append(orjson.dumps(detail) + b"\n")
+            
+            if len(batch) >= RESULTS_FLUSH_BATCH or loop.time() >= flush_at:
+                await flush()
+                flush_at = loop.time() + RESULTS_FLUSH_INTERVAL
+        
+        await flush()
     
-    return personalized_message
+    if write_error is not None:
+        raise write_error
 
-async def process_csv_file_and_send_messages(file_path: str, template_message: str) -> dict:
+async def process_csv_file_and_send_messages(file_path: str, template: MessageTemplate) -> dict:
     """Process contacts from uploaded CSV and send personalized marketing messages"""
-    results = {
-        "total": 0,
-        "successful": 0,
-        "failed": 0,
-        "details": []
-    }
-    
     # Initialize campaign status
     file_name = os.path.basename(file_path)
-    campaign_status[file_name] = {
-        "status": "processing",
-        "processed": 0,
-        "total": 0,
-        "successful": 0,
-        "failed": 0
-    }
+    results_path = os.path.join(UPLOAD_DIR, f"{file_name}.results.jsonl")
+    stats = campaign_status[file_name] = CampaignStats()
+    
+    if not os.path.exists(file_path):
+        logger.error(f"CSV file not found: {file_path}")
+        stats.status = "failed"
+        return {"error": f"CSV file not found: {file_path}"}
+    
+    # Opened before any worker starts, so an unwritable results path fails the campaign up front
+    try:
+        results_file = open(results_path, 'wb')
+    except OSError as e:
+        logger.error("Cannot open results file %s: %s", results_path, e)
+        stats.status = "failed"
+        return {"error": f"Cannot open results file: {e}"}
+    
+    # Per-contact results go through a bounded queue to a single writer instead of accumulating in RAM
+    results_queue = asyncio.Queue(maxsize=RESULTS_QUEUE_SIZE)
+    writer = asyncio.create_task(_results_writer(results_file, results_queue))
+    
+    # The CSV reader produces rows into a bounded queue consumed by a fixed pool of send workers
+    rows_queue = asyncio.Queue(maxsize=MAX_PENDING_SENDS)
+    workers = [
+        asyncio.create_task(_send_worker(rows_queue, template, stats, results_queue))
+        for _ in range(MAX_CONCURRENT_SENDS)
+    ]
+    error = None
     
     try:
-        if not os.path.exists(file_path):
-            logger.error(f"CSV file not found: {file_path}")
-            campaign_status[file_name]["status"] = "failed"
-            return {"error": f"CSV file not found: {file_path}"}
+        rows_read = 0
+        seen_phones = set()
+        # One open file serves both the line count and the CSV parse
+        with open(file_path, 'rb', buffering=CSV_READ_BUFFER) as raw:
+            # Both passes (count, then parse) read front to back; let the kernel read ahead aggressively
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(raw.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            
+            # Publish an estimated total for progress reporting; corrected once the CSV is exhausted.
+            # Counting scans the whole file, so it runs in a thread to keep the event loop free
+            stats.total = await asyncio.to_thread(_count_data_lines, raw)
             
-        # First, count total rows
-        with open(file_path, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            campaign_status[file_name]["total"] = sum(1 for _ in reader)
+            csvfile = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            reader = csv.reader(csvfile)
+            header = next(reader, [])
+            
+            # Copy only the columns the sender and the template use out of each row
+            columns = {'Mobile', 'Name of the Exhibitor', *template.variables}
+            column_indices = [(name, i) for i, name in enumerate(header) if name in columns]
+            
+            # Template variables without a column render as placeholders in every message
+            missing = [var for var in dict.fromkeys(template.variables) if var not in header]
+            if missing:
+                logger.warning("Template variables not found in CSV columns: %s", ", ".join(missing))
             
-        # Now process each row
-        with open(file_path, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
             for row in reader:
-                results["total"] += 1
+                # Skip blank lines, as DictReader did
+                if not row:
+                    continue
+                contact = {name: row[i] for name, i in column_indices if i < len(row)}
+                rows_read += 1
                 
-                try:
-                    # Extract phone number
-                    phone = row.get('Mobile', '')
-                    
-                    if not phone:
-                        raise ValueError("Mobile number missing or empty")
-                    
-                    # Personalize the message with all available fields from the CSV
-                    personalized_message = personalize_message(template_message, row)
-                    
-                    # Send personalized text message
-                    success = await send_whatsapp_text_message(phone, personalized_message)
-                    
-                    # Record result
-                    result_detail = {
-                        "phone": phone,
-                        "company": row.get('Name of the Exhibitor', 'unknown'),
-                        "success": success,
-                        "message": "Message sent" if success else "Failed to send"
-                    }
-                    
-                    # Update counts
-                    campaign_status[file_name]["processed"] += 1
-                    
-                    if success:
-                        results["successful"] += 1
-                        campaign_status[file_name]["successful"] += 1
-                    else:
-                        results["failed"] += 1
-                        campaign_status[file_name]["failed"] += 1
-                        
-                    results["details"].append(result_detail)
-                    
-                    # Add delay between messages to avoid rate limits
-                    logger.info(f"Waiting {MESSAGE_DELAY} seconds before sending next message...")
-                    await asyncio.sleep(MESSAGE_DELAY)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing contact: {str(e)}")
-                    results["failed"] += 1
-                    campaign_status[file_name]["failed"] += 1
-                    campaign_status[file_name]["processed"] += 1
-                    results["details"].append({
-                        "phone": row.get('Mobile', 'unknown'),
-                        "company": row.get('Name of the Exhibitor', 'unknown'),
-                        "success": False,
-                        "message": f"Error: {str(e)}"
-                    })
-        
-        # Mark campaign as completed
-        campaign_status[file_name]["status"] = "completed"
+                # Invalid and repeated numbers are settled here without spending an API call
+                phone = normalize_phone(contact.get('Mobile') or '', DEFAULT_COUNTRY_CODE)
+                if phone is None:
+                    detail = _result_detail(contact, False, "Error: Mobile number missing or invalid")
+                    await _record_result(stats, results_queue, "failed", detail)
+                elif phone in seen_phones:
+                    detail = _result_detail(contact, False, "Skipped: duplicate mobile number")
+                    await _record_result(stats, results_queue, "skipped", detail)
+                else:
+                    seen_phones.add(phone)
+                    contact['Mobile'] = phone
+                    await rows_queue.put(contact)
+        stats.total = rows_read
     
     except Exception as e:
         logger.error(f"Error reading CSV file: {str(e)}")
-        campaign_status[file_name]["status"] = "failed"
-        return {"error": str(e)}
+        stats.status = "failed"
+        error = str(e)
     
-    return results
+    finally:
+        # Workers drain the rows already queued and stop at the sentinels, then the writer is stopped
+        for _ in workers:
+            await rows_queue.put(None)
+        await asyncio.gather(*workers, return_exceptions=True)
+        await results_queue.put(None)
+        try:
+            await writer
+        except OSError as e:
+            logger.error("Error writing campaign results to %s: %s", results_path, e)
+            stats.status = "failed"
+            error = error or str(e)
+    
+    if error is not None:
+        return {"error": error}
+    
+    # Mark campaign as completed
+    stats.status = "completed"
+    
+    return {
+        "total": stats.total,
+        "successful": stats.successful,
+        "failed": stats.failed,
+        "skipped": stats.skipped,
+        "results_file": results_path
+    }
+
+def _save_upload(source: BinaryIO, file_path: str):
+    """Write an uploaded file to disk; blocking, so callers run it in a worker thread"""
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer, UPLOAD_CHUNK_SIZE)
 
 @app.post("/upload-csv")
 async def upload_csv(
@@ -218,12 +420,12 @@ Ashendra Sharma
         # Create a unique file path
         file_path = os.path.join(UPLOAD_DIR, file.filename)
         
-        # Save the file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Save the file in a worker thread so the event loop keeps serving other requests
+        await asyncio.to_thread(_save_upload, file.file, file_path)
         
-        # Start background processing with the provided template message
-        background_tasks.add_task(process_csv_file_and_send_messages, file_path, template_message)
+        # Parse the template once for the whole campaign, then start background processing
+        template = build_template(template_message)
+        background_tasks.add_task(process_csv_file_and_send_messages, file_path, template)
         
         return {
             "message": "CSV file uploaded and campaign started with personalized messages",
@@ -237,51 +439,60 @@ Ashendra Sharma
 @app.get("/campaign-status/{filename}")
 async def get_campaign_status(filename: str):
     """Get the status of a campaign by filename"""
-    if filename not in campaign_status:
+    # Look up and copy under the lock, so the entry can't be evicted or observed mid-update
+    async with status_lock:
+        stats = campaign_status.get(filename)
+        if stats is not None:
+            stats = replace(stats)
+    
+    if stats is None:
         return {
             "status": "not_found",
             "message": "Campaign not found"
         }
     
-    status_data = campaign_status[filename]
-    
-    # Calculate success rate if there are processed messages
+    # Calculate success rate over the messages actually attempted (duplicates are skipped)
+    attempted = stats.processed - stats.skipped
     success_rate = "0%"
-    if status_data["processed"] > 0:
-        rate = (status_data["successful"] / status_data["processed"]) * 100
+    if attempted > 0:
+        rate = (stats.successful / attempted) * 100
         success_rate = f"{rate:.1f}%"
     
     return {
-        "status": status_data["status"],
-        "processed": status_data["processed"],
-        "total": status_data["total"],
-        "successful": status_data["successful"],
-        "failed": status_data["failed"],
+        "status": stats.status,
+        "processed": stats.processed,
+        "total": stats.total,
+        "successful": stats.successful,
+        "failed": stats.failed,
+        "skipped": stats.skipped,
         "success_rate": success_rate
     }
 
 @app.get("/test-auth")
 async def test_auth():
     """Test the WhatsApp API authentication"""
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_API_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://graph.facebook.com/v22.0/{WHATSAPP_PHONE_NUMBER_ID}",
-                headers=headers
-            )
-            return {
-                "status_code": response.status_code,
-                "response": response.json() if response.status_code == 200 else response.text,
-                "token_present": bool(WHATSAPP_API_TOKEN),
-                "token_length": len(WHATSAPP_API_TOKEN) if WHATSAPP_API_TOKEN else 0
-            }
+        response = await whatsapp_client.get_phone_number_info()
+        token = whatsapp_client.WHATSAPP_API_TOKEN
+        return {
+            "status_code": response.status_code,
+            "response": orjson.loads(response.content) if response.status_code == 200 else response.text,
+            "token_present": bool(token),
+            "token_length": len(token) if token else 0
+        }
     except Exception as e:
         return {"error": str(e)}
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Campaign status, the send semaphore and the rate limiter live in process memory, so extra
+    # workers each get their own copy; only raise UVICORN_WORKERS behind sticky routing
+    reload = os.getenv("UVICORN_RELOAD", "").lower() in ("1", "true", "yes")
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=reload,
+        workers=1 if reload else int(os.getenv("UVICORN_WORKERS", "1")),
+        loop="uvloop",
+        http="httptools"
+    )
\ No newline at end of file
@@ -0,0 +1,26 @@
+# Longest national number (without country code) accepted before a default country code is added
+NATIONAL_NUMBER_MAX_DIGITS = 10
+
+# Separators removed from phone numbers in one C-level pass with str.translate;
+# '.' is not one, since stripping it from 9876500004.1 would invent a different number
+PHONE_STRIP_TABLE = str.maketrans('', '', ' \t\r\n-()')
+
+def normalize_phone(raw: str, default_country_code: str) -> str | None:
+    """Normalize a phone number to E.164 ('+' and 8-15 digits), or return None if it can't be valid"""
+    phone = raw.translate(PHONE_STRIP_TABLE)
+    # Spreadsheets export numeric cells as floats ("9876500004.0"); any other '.' is rejected below
+    phone = phone.removesuffix('.0')
+    if phone.startswith('+'):
+        digits = phone[1:]
+    elif phone.startswith('00'):
+        # International dialling prefix
+        digits = phone[2:]
+    else:
+        # Drop any trunk prefix; short numbers are national and get the default country code
+        digits = phone.lstrip('0')
+        if len(digits) <= NATIONAL_NUMBER_MAX_DIGITS:
+            digits = default_country_code + digits
+    
+    if not (digits.isascii() and digits.isdigit()) or not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
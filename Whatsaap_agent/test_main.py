@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def campaign(tmp_path, monkeypatch):
+    """A campaign CSV with more rows than the results queue holds, and a sender that always succeeds"""
+    async def send_text(phone, text_message):
+        return True
+    
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "RESULTS_QUEUE_SIZE", 5)
+    monkeypatch.setattr(main, "RESULTS_FLUSH_BATCH", 3)
+    monkeypatch.setattr(main.whatsapp_client, "send_text", send_text)
+    
+    csv_path = tmp_path / "campaign.csv"
+    rows = "".join(f"98000{i:05d},Company {i}\n" for i in range(200))
+    csv_path.write_text("Mobile,Name of the Exhibitor\n" + rows)
+    return csv_path
+
+
+def _run(csv_path):
+    template = main.build_template("Hello {{Name of the Exhibitor}}")
+    return asyncio.run(asyncio.wait_for(main.process_csv_file_and_send_messages(str(csv_path), template), 10))
+
+
+def test_campaign_fails_when_results_cannot_be_written(campaign, monkeypatch):
+    def fail(results_file, lines):
+        raise OSError(28, "No space left on device")
+    
+    monkeypatch.setattr(main, "_append_lines", fail)
+    
+    result = _run(campaign)
+    
+    assert "No space left on device" in result["error"]
+    stats = main.campaign_status["campaign.csv"]
+    assert stats.status == "failed"
+    assert stats.processed == 200
+
+
+def test_campaign_fails_when_results_file_cannot_be_opened(campaign):
+    (campaign.parent / "campaign.csv.results.jsonl").mkdir()
+    
+    result = _run(campaign)
+    
+    assert "Cannot open results file" in result["error"]
+    assert main.campaign_status["campaign.csv"].status == "failed"
+
+
+def test_campaign_writes_all_results(campaign):
+    result = _run(campaign)
+    
+    assert "error" not in result
+    assert main.campaign_status["campaign.csv"].status == "completed"
+    assert len((campaign.parent / "campaign.csv.results.jsonl").read_bytes().splitlines()) == 200
+
+
+def test_missing_template_variable_is_warned_once_per_campaign(campaign, caplog):
+    template = main.build_template("Hello {{Name of the Exhibitor}} at {{Booth}}")
+    
+    with caplog.at_level("WARNING", logger="main"):
+        asyncio.run(main.process_csv_file_and_send_messages(str(campaign), template))
+    
+    warnings = [r.getMessage() for r in caplog.records if "Booth" in r.getMessage()]
+    assert warnings == ["Template variables not found in CSV columns: Booth"]
+
+
+def test_campaign_status_cache_evicts_least_recently_used_finished_campaign():
+    cache = main.CampaignStatusCache(2)
+    cache["a"] = main.CampaignStats(status="completed")
+    cache["b"] = main.CampaignStats(status="completed")
+    cache.get("a")
+    cache["c"] = main.CampaignStats()
+    
+    assert list(cache) == ["a", "c"]
+
+
+def test_campaign_status_cache_keeps_campaigns_in_progress():
+    cache = main.CampaignStatusCache(1)
+    cache["a"] = main.CampaignStats()
+    cache["b"] = main.CampaignStats()
+    
+    assert list(cache) == ["a", "b"]
+    
+    cache["a"].status = "completed"
+    cache["c"] = main.CampaignStats()
+    
+    assert list(cache) == ["b", "c"]
+
+
+def test_message_template_is_hashable_and_renders_placeholders():
+    template = main.build_template("Hi {{Name}}, see you at {{Booth}}!")
+    
+    assert hash(template) == hash(main.build_template("Hi {{Name}}, see you at {{Booth}}!"))
+    assert template.render({"Name": "Asha"}) == "Hi Asha, see you at [Booth]!"
@@ -0,0 +1,27 @@
+from phone_numbers import normalize_phone
+
+
+def test_normalize_phone_adds_default_country_code():
+    assert normalize_phone("98765 00004", "91") == "+919876500004"
+    assert normalize_phone("09876500004", "91") == "+919876500004"
+
+
+def test_normalize_phone_keeps_international_numbers():
+    assert normalize_phone("+44 (20) 7946-0958", "91") == "+442079460958"
+    assert normalize_phone("00442079460958", "91") == "+442079460958"
+
+
+def test_normalize_phone_accepts_spreadsheet_float_export():
+    assert normalize_phone("9876500004.0", "91") == "+919876500004"
+    assert normalize_phone("919876500004.0", "91") == "+919876500004"
+
+
+def test_normalize_phone_rejects_invalid_numbers():
+    assert normalize_phone("", "91") is None
+    assert normalize_phone("98765.00004", "91") is None
+    assert normalize_phone("9.8765E+09", "91") is None
+    assert normalize_phone("12345", "91") is None
+
+
+def test_normalize_phone_uses_given_default_country_code():
+    assert normalize_phone("2079460958", "44") == "+442079460958"
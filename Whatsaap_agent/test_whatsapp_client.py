@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+import pytest
+from aiolimiter import AsyncLimiter
+
+import whatsapp_client
+
+
+def _send(monkeypatch, handler):
+    """Run send_text against a mock transport, returning its result and the number of POSTs made"""
+    calls = []
+    
+    def counting_handler(request):
+        calls.append(request)
+        return handler(request)
+    
+    async def go():
+        monkeypatch.setattr(whatsapp_client, "LIMITER", AsyncLimiter(1000, 1))
+        monkeypatch.setattr(whatsapp_client, "CLIENT", httpx.AsyncClient(transport=httpx.MockTransport(counting_handler)))
+        try:
+            return await whatsapp_client.send_text("+919876500004", "hi")
+        finally:
+            await whatsapp_client.CLIENT.aclose()
+    
+    monkeypatch.setattr(whatsapp_client, "_backoff_delay", lambda attempt: 0.0)
+    monkeypatch.setattr(whatsapp_client, "_sends_paused_until", 0.0)
+    return asyncio.run(go()), len(calls)
+
+
+def test_send_text_retries_connect_errors(monkeypatch):
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+    
+    assert _send(monkeypatch, handler) == (False, whatsapp_client.MAX_SEND_ATTEMPTS)
+
+
+@pytest.mark.parametrize("error", [httpx.ReadTimeout, httpx.ReadError, httpx.WriteError, httpx.RemoteProtocolError])
+def test_send_text_does_not_resend_after_request_may_have_arrived(monkeypatch, error):
+    calls = []
+    
+    def handler(request):
+        calls.append(request)
+        raise error("dropped", request=request)
+    
+    with pytest.raises(whatsapp_client.DeliveryUnknownError):
+        _send(monkeypatch, handler)
+    assert len(calls) == 1
+
+
+def _usage(header):
+    return whatsapp_client._usage_backoff(httpx.Response(200, headers={"X-Business-Use-Case-Usage": header}))
+
+
+@pytest.mark.parametrize("header", [
+    'not json',
+    '[1, 2]',
+    '{"1": 5}',
+    '{"1": [1, 2]}',
+    '{"1": [{"call_count": "95"}]}',
+    '{"1": [{"estimated_time_to_regain_access": [1]}]}',
+])
+def test_usage_backoff_ignores_malformed_headers(header):
+    assert _usage(header) == 0.0
+
+
+def test_usage_backoff_keeps_valid_entries_next_to_malformed_ones():
+    assert _usage('{"1": [{"call_count": 95}, {"estimated_time_to_regain_access": "5"}]}') == whatsapp_client.USAGE_BACKOFF_SECONDS
+    assert _usage('{"1": [7, {"estimated_time_to_regain_access": 2}]}') == 120.0
+
+
+def test_send_text_counts_200_as_sent_despite_malformed_usage_header(monkeypatch):
+    def handler(request):
+        return httpx.Response(200, headers={"X-Business-Use-Case-Usage": '{"1": [1, 2]}'}, json={})
+    
+    assert _send(monkeypatch, handler) == (True, 1)
@@ -0,0 +1,205 @@
+import os
+import asyncio
+import logging
+import random
+import time
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Environment variables
+WHATSAPP_API_TOKEN = os.getenv("ACCESS_TOKEN")
+WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
+WHATSAPP_PHONE_NUMBER_URL = f"https://graph.facebook.com/v22.0/{WHATSAPP_PHONE_NUMBER_ID}"
+WHATSAPP_API_URL = f"{WHATSAPP_PHONE_NUMBER_URL}/messages"
+HEADERS = {
+    "Authorization": f"Bearer {WHATSAPP_API_TOKEN}",
+    "Content-Type": "application/json"
+}
+
+# WhatsApp rate limit (messages per minute), enforced by a token bucket shared by all campaigns
+MESSAGES_PER_MINUTE = int(os.getenv("MESSAGES_PER_MINUTE", "50"))
+LIMITER = AsyncLimiter(MESSAGES_PER_MINUTE, 60)
+
+# Fields shared by every text message body; only "to" and "text" vary per send
+TEXT_MESSAGE_BASE = {
+    "messaging_product": "whatsapp",
+    "type": "text"
+}
+
+# TEXT_MESSAGE_BASE serialized once; each send splices in only its JSON-encoded "to" and "text"
+_TEXT_BODY_PREFIX = orjson.dumps(TEXT_MESSAGE_BASE)[:-1] + b',"to":'
+_TEXT_BODY_MIDDLE = b',"text":{"body":'
+_TEXT_BODY_SUFFIX = b'}}'
+
+# Attempts per message when WhatsApp answers 429, 5xx, a rate-limit error or no connection can be made
+MAX_SEND_ATTEMPTS = 5
+
+# Upper bound on the exponential backoff between attempts (seconds)
+MAX_RETRY_DELAY = 30
+
+# Graph API / WhatsApp error codes that mean "slow down" rather than "bad request"
+RATE_LIMIT_ERROR_CODES = {4, 613, 80007, 130429, 131056}
+
+# X-Business-Use-Case-Usage percentage at which new sends pause, and for how long
+USAGE_BACKOFF_THRESHOLD = 90
+USAGE_BACKOFF_SECONDS = 30
+
+# Monotonic time before which no new send is started (set from Meta's usage feedback)
+_sends_paused_until = 0.0
+
+# HTTP/2 connections to the Graph API; each multiplexes ~100 concurrent sends,
+# so a few are enough to saturate the rate limit with few TLS handshakes
+MAX_CONNECTIONS = int(os.getenv("WHATSAPP_MAX_CONNECTIONS", "4"))
+
+# Errors raised before the request left this process, so a retry cannot deliver the message twice
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class DeliveryUnknownError(Exception):
+    """The connection failed after the message was written, so Meta may or may not have accepted it"""
+
+# Shared HTTP client, created on startup so every send reuses pooled connections
+CLIENT: httpx.AsyncClient | None = None
+
+async def open_client():
+    """Create the shared WhatsApp API client; call once at application startup"""
+    global CLIENT
+    CLIENT = httpx.AsyncClient(
+        # No transport-level retries: the sender retries failed connects with backoff, as it does 429/5xx
+        transport=httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            http1=False,
+            http2=True
+        ),
+        timeout=10.0,
+        headers=HEADERS
+    )
+
+async def close_client():
+    """Close the shared WhatsApp API client; call once at application shutdown"""
+    if CLIENT is not None:
+        await CLIENT.aclose()
+
+def _backoff_delay(attempt: int) -> float:
+    """Jittered exponential backoff for the given attempt, capped at MAX_RETRY_DELAY seconds"""
+    return min(2 ** attempt + random.random(), MAX_RETRY_DELAY)
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying, honouring Retry-After and falling back to exponential backoff"""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return _backoff_delay(attempt)
+
+def _is_rate_limited(response: httpx.Response) -> bool:
+    """Whether the API rejected the request for exceeding a rate limit"""
+    if response.status_code == 429:
+        return True
+    try:
+        return orjson.loads(response.content)["error"]["code"] in RATE_LIMIT_ERROR_CODES
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        return False
+
+def _usage_backoff(response: httpx.Response) -> float:
+    """Seconds to pause all sends, derived from Meta's X-Business-Use-Case-Usage header"""
+    header = response.headers.get("X-Business-Use-Case-Usage")
+    if not header:
+        return 0.0
+    try:
+        usage = orjson.loads(header)
+    except orjson.JSONDecodeError:
+        return 0.0
+    if not isinstance(usage, dict):
+        return 0.0
+    
+    backoff = 0.0
+    # The header is advisory: malformed entries are skipped, never failing the send
+    # or discarding a backoff found in another entry
+    for entries in usage.values():
+        if not isinstance(entries, list):
+            continue
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                # estimated_time_to_regain_access is reported in minutes once a limit is hit
+                regain_minutes = entry.get("estimated_time_to_regain_access") or 0
+                peak = max(entry.get("call_count", 0), entry.get("total_cputime", 0), entry.get("total_time", 0))
+                if regain_minutes:
+                    backoff = max(backoff, regain_minutes * 60.0)
+                elif peak >= USAGE_BACKOFF_THRESHOLD:
+                    backoff = max(backoff, USAGE_BACKOFF_SECONDS)
+            except TypeError:
+                continue
+    return backoff
+
+async def _wait_for_send_window():
+    """Sleep while sends are paused because Meta reported high usage"""
+    delay = _sends_paused_until - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+async def send_text(phone: str, text_message: str) -> bool:
+    """Send a personalized text message via WhatsApp Cloud API; raises DeliveryUnknownError if the outcome is unknown"""
+    global _sends_paused_until
+    content = b"".join((
+        _TEXT_BODY_PREFIX, orjson.dumps(phone),
+        _TEXT_BODY_MIDDLE, orjson.dumps(text_message),
+        _TEXT_BODY_SUFFIX
+    ))
+    
+    try:
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            await _wait_for_send_window()
+            
+            # Every attempt, including retries, takes a token from the shared rate limiter
+            try:
+                async with LIMITER:
+                    response = await CLIENT.post(WHATSAPP_API_URL, content=content)
+            except NOT_SENT_ERRORS as e:
+                # Nothing reached Meta yet; give up only on the last attempt
+                if attempt + 1 == MAX_SEND_ATTEMPTS:
+                    raise
+                delay = _backoff_delay(attempt)
+                logger.warning("Network error sending to %s (%r), retrying in %.1fs", phone, e, delay)
+                await asyncio.sleep(delay)
+                continue
+            except httpx.TransportError as e:
+                # /messages is not idempotent: re-POSTing after a read/write/protocol error could send twice
+                raise DeliveryUnknownError(repr(e)) from e
+            
+            # Let Meta's usage feedback hold back every sender, not just this one
+            backoff = _usage_backoff(response)
+            if backoff:
+                logger.warning("WhatsApp API usage is high, pausing sends for %.0fs", backoff)
+                _sends_paused_until = max(_sends_paused_until, time.monotonic() + backoff)
+            
+            if response.status_code == 200:
+                logger.debug("Message sent successfully to %s", phone)
+                return True
+            
+            retryable = response.status_code >= 500 or _is_rate_limited(response)
+            if not retryable or attempt + 1 == MAX_SEND_ATTEMPTS:
+                break
+            
+            delay = _retry_delay(response, attempt)
+            logger.warning("WhatsApp API returned %s for %s, retrying in %.1fs", response.status_code, phone, delay)
+            await asyncio.sleep(delay)
+        
+        logger.error("Failed to send message to %s: %s", phone, response.text)
+        return False
+    except DeliveryUnknownError:
+        raise
+    except Exception as e:
+        logger.error("Error sending WhatsApp message to %s: %s", phone, e)
+        return False
+
+async def get_phone_number_info() -> httpx.Response:
+    """Fetch the configured phone number from the Graph API, e.g. to check the access token"""
+    return await CLIENT.get(WHATSAPP_PHONE_NUMBER_URL)